@@ -1,54 +1,113 @@
 # crawler.py
+import asyncio
 import httpx
+import orjson
 import re
+from collections import OrderedDict
+from math import ceil
 from typing import List, Optional
 from models import Apartment
 from sqlmodel import Session, select
 from database import engine
 import logging
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Size (e.g., "35 m²") or room layout (e.g., "1+kk", "2+1"), matched in a single scan
+_SIZE_LAYOUT_RE = re.compile(r'(?P<size>\d+)\s*m²|(?P<layout>\d+\+\w+)')
+# A layout match can swallow the digits of a size (e.g., "2+45 m²"), so sizes are rechecked within it
+_SIZE_RE = re.compile(r'(\d+)\s*m²')
+_SIZE_SUFFIX_RE = re.compile(r'\s*m²')
+
+# Prague locality keywords ("Praha", "Prague", "Praze")
+_PRAGUE_RE = re.compile(r'Pra(?:ha|gue|ze)')
+
+# Estate fields read by the crawler; everything else is dropped after parsing
+_ESTATE_FIELDS = ("hash_id", "name", "price", "price_czk", "locality", "labelsAll", "gps", "_links")
+
+# Garage label keywords, lowercased once for case-insensitive matching
+_GARAGE_KEYWORDS = tuple(k.lower() for k in ("garage", "Garáž", "Parkování", "parking_lots"))
+
+class CrawlError(Exception):
+    """Raised when sreality cannot be fetched"""
+
 class SrealityCrawler:
     def __init__(self):
         self.base_url = "https://www.sreality.cz/api/cs/v2/estates"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+        self.max_pages = 10  # Upper bound on pages fetched per crawl
+        # Recently seen hash_ids, oldest first; seeded from the DB on first crawl
+        self.seen_capacity = 10000
+        self._seen: Optional[OrderedDict] = None
+        self._save_lock = asyncio.Lock()  # Serializes the DB phase and _seen updates
+        # Shared client so keep-alive connections are reused between crawls
+        self.client = httpx.AsyncClient(
+            timeout=30.0,
+            headers=self.headers,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+        )
+
+    async def aclose(self):
+        """Close the underlying HTTP client"""
+        await self.client.aclose()
+
+    def _load_seen(self, session: Session):
+        """Seed the seen cache with the most recently stored hash_ids"""
+        recent = session.exec(
+            select(Apartment.hash_id).order_by(Apartment.id.desc()).limit(self.seen_capacity)
+        ).all()
+        self._seen = OrderedDict((hash_id, None) for hash_id in reversed(recent))
+
+    def _remember(self, hash_ids):
+        """Add hash_ids to the seen cache, evicting the oldest over capacity"""
+        for hash_id in hash_ids:
+            self._seen[hash_id] = None
+            self._seen.move_to_end(hash_id)
+        while len(self._seen) > self.seen_capacity:
+            self._seen.popitem(last=False)
 
     def extract_size_and_layout(self, name: str) -> tuple[Optional[int], Optional[str]]:
         """Extract size in m² and room layout from apartment name"""
-        # Extract size (e.g., "35 m²")
-        size_match = re.search(r'(\d+)\s*m²', name)
-        size_sqm = int(size_match.group(1)) if size_match else None
+        size_sqm = None
+        room_layout = None
 
-        # Extract room layout (e.g., "1+kk", "2+1")
-        layout_match = re.search(r'(\d+\+\w+)', name)
-        room_layout = layout_match.group(1) if layout_match else None
+        # Keep the first size and the first layout found
+        for match in _SIZE_LAYOUT_RE.finditer(name):
+            if match.group("size") is not None:
+                if size_sqm is None:
+                    size_sqm = int(match.group("size"))
+            else:
+                if room_layout is None:
+                    room_layout = match.group("layout")
+                if size_sqm is None:
+                    # Look for a size starting inside the layout, up to a directly following "m²"
+                    suffix = _SIZE_SUFFIX_RE.match(name, match.end())
+                    end = suffix.end() if suffix else match.end()
+                    inner = _SIZE_RE.search(name, match.start() + 1, end)
+                    if inner:
+                        size_sqm = int(inner.group(1))
+            if size_sqm is not None and room_layout is not None:
+                break
 
         return size_sqm, room_layout
 
     def is_prague_locality(self, locality: str) -> bool:
         """Check if locality is in Prague"""
-        prague_keywords = ["Praha", "Prague", "Praze"]
-        return any(keyword in locality for keyword in prague_keywords)
+        return _PRAGUE_RE.search(locality) is not None
 
-    def has_garage(self, labels: List[str], labels_all: List[List[str]]) -> bool:
+    def has_garage(self, labels_all: List[List[str]]) -> bool:
         """Check if apartment has garage"""
-        garage_keywords = ["garage", "Garáž", "Parkování", "parking_lots"]
-
-        # Check in main labels
-        for label in labels:
-            if any(keyword.lower() in label.lower() for keyword in garage_keywords):
-                return True
-
-        # Check in all labels
-        for label_group in labels_all:
-            for label in label_group:
-                if any(keyword.lower() in label.lower() for keyword in garage_keywords):
-                    return True
-
-        return False
+        # Main labels are a subset of labelsAll, so a single pass covers both
+        return any(
+            keyword in label
+            for label_group in labels_all
+            for label in map(str.lower, label_group)
+            for keyword in _GARAGE_KEYWORDS
+        )
 
     def extract_images(self, links: dict) -> List[str]:
         """Extract image URLs from _links"""
@@ -58,6 +117,20 @@ class SrealityCrawler:
                 images.append(image_link["href"])
         return images
 
+    def _slim_page(self, data: dict) -> dict:
+        """Keep only the paging info and estate fields the crawler uses"""
+        estates = data.get("_embedded", {}).get("estates", [])
+        return {
+            "result_size": data.get("result_size", 0),
+            "per_page": data.get("per_page"),
+            "_embedded": {
+                "estates": [
+                    {key: estate[key] for key in _ESTATE_FIELDS if key in estate}
+                    for estate in estates
+                ]
+            }
+        }
+
     async def fetch_apartments(self, page: int = 1) -> Optional[dict]:
         """Fetch apartments from sreality API"""
         params = {
@@ -67,14 +140,9 @@ class SrealityCrawler:
         }
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    self.base_url,
-                    params=params,
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                return response.json()
+            response = await self.client.get(self.base_url, params=params)
+            response.raise_for_status()
+            return self._slim_page(orjson.loads(response.content))
         except httpx.RequestError as e:
             logger.error(f"Request failed: {e}")
             return None
@@ -84,17 +152,54 @@ class SrealityCrawler:
 
     async def crawl_and_save_apartments(self) -> List[Apartment]:
         """Main crawling function"""
-        new_apartments = []
-
         # Fetch first page to get total results
         data = await self.fetch_apartments(page=1)
         if not data:
-            logger.error("Failed to fetch data from sreality")
-            return new_apartments
+            # Raise so periodic_crawl backs off instead of treating this as success
+            raise CrawlError("Failed to fetch data from sreality")
 
         estates = data.get("_embedded", {}).get("estates", [])
 
-        with Session(engine) as session:
+        # Fetch the remaining pages concurrently over the shared client
+        per_page = data.get("per_page") or len(estates)
+        total_pages = ceil(data.get("result_size", 0) / per_page) if per_page else 1
+        total_pages = min(total_pages, self.max_pages)
+        if total_pages > 1:
+            pages = await asyncio.gather(
+                *(self.fetch_apartments(page=p) for p in range(2, total_pages + 1))
+            )
+            for page_data in pages:
+                if page_data:
+                    estates.extend(page_data.get("_embedded", {}).get("estates", []))
+
+        # Deduplicate estates that shifted between pages while fetching
+        estates = list({e.get("hash_id"): e for e in estates}.values())
+
+        # Run the blocking DB work off the event loop, one crawl at a time so a
+        # manual trigger can't insert the same hash_ids as the periodic crawl
+        async with self._save_lock:
+            return await asyncio.to_thread(self._save_estates, estates)
+
+    def _save_estates(self, estates: List[dict]) -> List[Apartment]:
+        """Insert estates not yet stored and return them as apartments"""
+        new_apartments = []
+        new_rows = []
+
+        # Run the lookup and inserts in one explicit transaction
+        with Session(engine) as session, session.begin():
+            if self._seen is None:
+                self._load_seen(session)
+
+            # Look up Prague estates missing from the seen cache in a single query
+            ids = [
+                e["hash_id"] for e in estates
+                if e.get("hash_id") and e["hash_id"] not in self._seen
+                and self.is_prague_locality(e.get("locality", ""))
+            ]
+            existing_ids = set(session.exec(
+                select(Apartment.hash_id).where(Apartment.hash_id.in_(ids))
+            ).all()) if ids else set()
+
             for estate_data in estates:
                 # Check if locality is Prague
                 locality = estate_data.get("locality", "")
@@ -105,12 +210,11 @@ class SrealityCrawler:
                 if not hash_id:
                     continue
 
-                # Check if apartment already exists
-                existing = session.exec(
-                    select(Apartment).where(Apartment.hash_id == hash_id)
-                ).first()
+                if hash_id in self._seen:
+                    self._seen.move_to_end(hash_id)
+                    continue  # Skip if seen recently
 
-                if existing:
+                if hash_id in existing_ids:
                     continue  # Skip if already exists
 
                 # Extract apartment data
@@ -122,9 +226,8 @@ class SrealityCrawler:
                 size_sqm, room_layout = self.extract_size_and_layout(name)
 
                 # Check for garage
-                labels = estate_data.get("labels", [])
                 labels_all = estate_data.get("labelsAll", [])
-                has_garage_flag = self.has_garage(labels, labels_all)
+                has_garage_flag = self.has_garage(labels_all)
 
                 # Extract GPS coordinates
                 gps = estate_data.get("gps", {})
@@ -134,8 +237,9 @@ class SrealityCrawler:
                 # Extract images
                 images = self.extract_images(estate_data.get("_links", {}))
 
-                # Create apartment object
-                apartment = Apartment(
+                # Build apartment row
+                now = datetime.now()
+                row = dict(
                     hash_id=hash_id,
                     name=name,
                     price=price,
@@ -146,13 +250,21 @@ class SrealityCrawler:
                     has_garage=has_garage_flag,
                     latitude=latitude,
                     longitude=longitude,
-                    images=images
+                    images=images,
+                    date_created=now,
+                    date_updated=now
                 )
 
-                session.add(apartment)
-                new_apartments.append(apartment)
+                new_rows.append(row)
+                new_apartments.append(Apartment(**row))
+                existing_ids.add(hash_id)  # Guard against duplicates within the page
                 logger.info(f"Added new apartment: {name} in {locality}")
 
-            session.commit()
+            # Insert all new rows at once, bypassing per-instance ORM bookkeeping
+            if new_rows:
+                session.bulk_insert_mappings(Apartment, new_rows)
+
+        # Only cache ids once the transaction has committed
+        self._remember(existing_ids)
 
         return new_apartments
\ No newline at end of file
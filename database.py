@@ -1,19 +1,42 @@
 # database.py
 from sqlmodel import create_engine, SQLModel, Session
+from sqlalchemy import event
 from sqlalchemy.pool import StaticPool
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./apartments.db")
 
+if DATABASE_URL.startswith("sqlite"):
+    # Sessions are used from worker threads; only an in-memory database
+    # needs a single shared connection to keep its data alive
+    engine_kwargs = dict(connect_args={"check_same_thread": False})
+    if ":memory:" in DATABASE_URL or DATABASE_URL == "sqlite://":
+        engine_kwargs["poolclass"] = StaticPool
+else:
+    engine_kwargs = dict(pool_size=10, max_overflow=20, pool_pre_ping=True)
+
 engine = create_engine(
     DATABASE_URL,
-    poolclass=StaticPool,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-    echo=True
+    echo=os.getenv("SQL_ECHO", "0") == "1",
+    **engine_kwargs
 )
 
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        """Use WAL journaling so commits append to the log instead of fsyncing a rollback journal"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    # create_all skips existing tables, so add any indexes missing from older databases
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def get_session():
     with Session(engine) as session:
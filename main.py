@@ -1,16 +1,19 @@
 # main.py
 from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from sqlmodel import Session, select
+from sqlalchemy import func, case
 from typing import List, Optional
 import asyncio
+import random
 from datetime import datetime, timedelta
 
-from models import Apartment, ApartmentResponse
+from models import Apartment, ApartmentResponse, ApartmentListResponse
 from database import create_db_and_tables, get_session
 from crawler import SrealityCrawler
 
-app = FastAPI(title="Prague Apartments Crawler", version="1.0.0")
+app = FastAPI(title="Prague Apartments Crawler", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Add CORS middleware for React frontend
 app.add_middleware(
@@ -25,17 +28,23 @@ app.add_middleware(
 crawler = SrealityCrawler()
 
 # Background task for periodic crawling
+CRAWL_INTERVAL = 60  # Seconds between successful crawls
+MAX_BACKOFF = 900  # Upper bound for the retry delay after failures
+
 async def periodic_crawl():
-    """Background task that runs every minute"""
+    """Background task that runs every minute, backing off exponentially on errors"""
+    backoff = CRAWL_INTERVAL
     while True:
         try:
             new_apartments = await crawler.crawl_and_save_apartments()
             print(f"Crawled {len(new_apartments)} new apartments at {datetime.now()}")
+            backoff = CRAWL_INTERVAL
         except Exception as e:
-            print(f"Error during crawling: {e}")
+            backoff = min(backoff * 2, MAX_BACKOFF)
+            print(f"Error during crawling: {e}, retrying in {backoff}s")
 
-        # Wait 1 minute
-        await asyncio.sleep(60)
+        # Wait before the next run, with jitter so retries don't align
+        await asyncio.sleep(backoff + random.uniform(0, 5))
 
 @app.on_event("startup")
 async def startup_event():
@@ -43,12 +52,16 @@ async def startup_event():
     # Start background crawling task
     asyncio.create_task(periodic_crawl())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await crawler.aclose()
+
 @app.get("/")
 async def root():
     return {"message": "Prague Apartments Crawler API"}
 
-@app.get("/apartments/", response_model=List[ApartmentResponse])
-async def get_apartments(
+@app.get("/apartments/", response_model=ApartmentListResponse)
+def get_apartments(
         skip: int = 0,
         limit: int = 20,
         min_price: Optional[int] = None,
@@ -60,33 +73,38 @@ async def get_apartments(
         session: Session = Depends(get_session)
 ):
     """Get apartments with optional filters"""
-    query = select(Apartment)
+    filters = []
 
     # Apply filters
     if min_price is not None:
-        query = query.where(Apartment.price >= min_price)
+        filters.append(Apartment.price >= min_price)
     if max_price is not None:
-        query = query.where(Apartment.price <= max_price)
+        filters.append(Apartment.price <= max_price)
     if min_size is not None:
-        query = query.where(Apartment.size_sqm >= min_size)
+        filters.append(Apartment.size_sqm >= min_size)
     if max_size is not None:
-        query = query.where(Apartment.size_sqm <= max_size)
+        filters.append(Apartment.size_sqm <= max_size)
     if has_garage is not None:
-        query = query.where(Apartment.has_garage == has_garage)
+        filters.append(Apartment.has_garage == has_garage)
     if room_layout is not None:
-        query = query.where(Apartment.room_layout == room_layout)
+        filters.append(Apartment.room_layout == room_layout)
+
+    # Total number of matches so clients can paginate
+    total = session.exec(
+        select(func.count(Apartment.id)).where(*filters)
+    ).one()
 
     # Order by date created (newest first)
-    query = query.order_by(Apartment.date_created.desc())
+    query = select(Apartment).where(*filters).order_by(Apartment.date_created.desc())
 
     # Apply pagination
     query = query.offset(skip).limit(limit)
 
     apartments = session.exec(query).all()
-    return apartments
+    return {"total": total, "items": apartments}
 
 @app.get("/apartments/{apartment_id}", response_model=ApartmentResponse)
-async def get_apartment(apartment_id: int, session: Session = Depends(get_session)):
+def get_apartment(apartment_id: int, session: Session = Depends(get_session)):
     """Get specific apartment by ID"""
     apartment = session.get(Apartment, apartment_id)
     if not apartment:
@@ -94,7 +112,7 @@ async def get_apartment(apartment_id: int, session: Session = Depends(get_sessio
     return apartment
 
 @app.get("/apartments/new/", response_model=List[ApartmentResponse])
-async def get_new_apartments(
+def get_new_apartments(
         hours: int = 24,
         session: Session = Depends(get_session)
 ):
@@ -115,19 +133,23 @@ async def trigger_crawl(background_tasks: BackgroundTasks):
     return {"message": "Crawling triggered"}
 
 @app.get("/stats/")
-async def get_stats(session: Session = Depends(get_session)):
+def get_stats(session: Session = Depends(get_session)):
     """Get basic statistics"""
-    total_apartments = session.exec(select(Apartment)).all()
-
-    total_count = len(total_apartments)
-    avg_price = sum(apt.price for apt in total_apartments) / total_count if total_count > 0 else 0
-    avg_size = sum(apt.size_sqm for apt in total_apartments if apt.size_sqm) / len([apt for apt in total_apartments if apt.size_sqm]) if total_apartments else 0
+    # Aggregate in SQL only; never load full rows here, memory must not grow with the table
+    total_count, avg_price, avg_size, garage_count = session.exec(
+        select(
+            func.count(Apartment.id),
+            func.avg(Apartment.price),
+            func.avg(case((Apartment.size_sqm > 0, Apartment.size_sqm))),  # Skip unknown/zero sizes
+            func.sum(case((Apartment.has_garage, 1), else_=0))
+        )
+    ).one()
 
     return {
         "total_apartments": total_count,
-        "average_price": round(avg_price, 2),
-        "average_size": round(avg_size, 2),
-        "apartments_with_garage": len([apt for apt in total_apartments if apt.has_garage])
+        "average_price": round(avg_price or 0, 2),
+        "average_size": round(avg_size or 0, 2),
+        "apartments_with_garage": garage_count or 0
     }
 
 if __name__ == "__main__":
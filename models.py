@@ -11,16 +11,16 @@ class Apartment(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     hash_id: int = Field(unique=True, index=True)  # Original hash_id from API
     name: str
-    price: int
+    price: int = Field(index=True)
     price_unit: str = Field(default="za měsíc")
     locality: str
-    size_sqm: Optional[int] = Field(default=None)  # Size in square meters
-    room_layout: Optional[str] = Field(default=None)  # e.g., "1+kk"
-    has_garage: bool = Field(default=False)
+    size_sqm: Optional[int] = Field(default=None, index=True)  # Size in square meters
+    room_layout: Optional[str] = Field(default=None, index=True)  # e.g., "1+kk"
+    has_garage: bool = Field(default=False, index=True)
     latitude: Optional[float] = Field(default=None)
     longitude: Optional[float] = Field(default=None)
     images: List[str] = Field(sa_column=Column(JSON))  # Store image URLs as JSON
-    date_created: datetime = Field(default_factory=datetime.now)
+    date_created: datetime = Field(default_factory=datetime.now, index=True)
     date_updated: datetime = Field(default_factory=datetime.now)
 
     class Config:
@@ -40,4 +40,8 @@ class ApartmentResponse(SQLModel):
     longitude: Optional[float]
     images: List[str]
     date_created: datetime
-    date_updated: datetime
\ No newline at end of file
+    date_updated: datetime
+
+class ApartmentListResponse(SQLModel):
+    total: int
+    items: List[ApartmentResponse]
\ No newline at end of file